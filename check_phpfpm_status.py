@@ -8,10 +8,12 @@ Nagios PHP-FPM check script
 """
 
 import sys
+import os
+import math
 import socket
+import stat
 import struct
-import json
-import argparse
+import time
 
 LISTEN_QUEUE_WARNING = 5
 LISTEN_QUEUE_CRITICAL = 10
@@ -22,6 +24,14 @@ ACTIVE_PROCESSES_PCT_CRITICAL = 90
 DEFAULT_FPM_SOCKET_PATH = "/run/php-fpm/www.sock"
 DEFAULT_FPM_STATUS_PATH = "/status"
 
+DAEMON_INTERVAL = 1.0
+
+# Seconds between attempts to take the cache lock
+CACHE_LOCK_RETRY_DELAY = 0.05
+
+# Status page fields used by the threshold checks
+CHECKED_STATUS_FIELDS = ("listen queue", "active processes", "total processes")
+
 class FCGIStatusClient:
     """
     Class implementing Fast CGI specification
@@ -31,129 +41,411 @@ class FCGIStatusClient:
 
     # FCGI record types
     FCGI_BEGIN_REQUEST = 1
+    FCGI_END_REQUEST = 3
     FCGI_PARAMS = 4
+    FCGI_STDOUT = 6
+    FCGI_STDERR = 7
 
     # FCGI roles
     FCGI_RESPONDER = 1
 
-    # FCGI header length
+    # FCGI begin request flags
+    FCGI_KEEP_CONN = 1
+
+    # FCGI end request protocol status
+    FCGI_REQUEST_COMPLETE = 0
+
+    # FCGI header length and layout
     FCGI_HDR_LENGTH = 8
+    FCGI_HDR = struct.Struct("!BBHHBx")
+
+    # FCGI_BeginRequestBody only depends on whether the connection is kept open
+    FCGI_BEGIN_REQUEST_BODY = struct.pack("!HB5x", FCGI_RESPONDER, 0)
+    FCGI_BEGIN_REQUEST_BODY_KEEP_CONN = struct.pack("!HB5x", FCGI_RESPONDER, FCGI_KEEP_CONN)
 
-    fcgi_begin_request = None
-    fcgi_params = None
-    raw_status_data = None
-    status_data = None
+    # Errors meaning php-fpm closed a kept-open connection
+    CONNECTION_LOST = (EOFError, BrokenPipeError, ConnectionResetError)
+
+    # Initial size of the receive buffer, large enough for a typical status page
+    RECV_BUFFER_SIZE = 8192
+
+    __slots__ = ('socket', 'socket_path', 'socket_timeout', 'status_path', 'keep_conn',
+                 'request_id', 'params', 'fcgi_begin_request', 'fcgi_params',
+                 'fcgi_params_body', 'raw_status_data', 'status_data',
+                 '_rxbuf')
 
     def __init__( self, socket_path = DEFAULT_FPM_SOCKET_PATH, socket_timeout = 1.0,
-                  status_path = DEFAULT_FPM_STATUS_PATH ):
-        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                  status_path = DEFAULT_FPM_STATUS_PATH, keep_conn = False ):
+        self.socket = None
         self.socket_path = socket_path
         self.set_socket_timeout(socket_timeout)
         self.status_path = status_path
-        self.request_id = 1
-
-        self.params = {
-            "SCRIPT_NAME": status_path,
-            "SCRIPT_FILENAME": status_path,
-            "QUERY_STRING": "",
-            "REQUEST_METHOD": "GET",
-        }
+        self.keep_conn = keep_conn
+        self.request_id = 0
+        self._rxbuf = bytearray(self.RECV_BUFFER_SIZE)
+        self.fcgi_begin_request = None
+        self.fcgi_params = None
+        self.raw_status_data = None
+        self.status_data = None
+
+        # Encoded once here, as they are sent unchanged with every request
+        status_path = status_path.encode()
+        self.params = (
+            (b"SCRIPT_NAME", status_path),
+            (b"SCRIPT_FILENAME", status_path),
+            (b"QUERY_STRING", b""),
+            (b"REQUEST_METHOD", b"GET"),
+        )
+        # Only the record headers change between requests, see define_params()
+        self.fcgi_params_body = self.encode_params()
 
     def set_socket_timeout(self, timeout):
         self.socket_timeout = timeout
-        self.socket.settimeout(self.socket_timeout)
+        if self.socket is not None:
+            self.socket.settimeout(self.socket_timeout)
 
     def connect(self):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(self.socket_timeout)
         try:
             self.socket.connect(self.socket_path)
         except:
-            print("Unable to connect to php-fpm socket, OS error: " + str(sys.exc_info()[1]))
-            sys.exit(3)
+            self.close()
+            self.report_error()
 
     def close(self):
-        self.socket.close()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def report_error(self):
+        print("Unable to connect to php-fpm socket, OS error: " + str(sys.exc_info()[1]))
+        sys.exit(3)
 
     def define_begin_request(self):
-        fcgi_begin_request = struct.pack("!HB5x", self.FCGI_RESPONDER, 0)
-        fcgi_hdr        = struct.pack("!BBHHBx", self.FCGI_VERSION, self.FCGI_BEGIN_REQUEST,
-                                          self.request_id, len(fcgi_begin_request), 0)
-        self.fcgi_begin_request = fcgi_hdr + fcgi_begin_request
+        if self.keep_conn:
+            fcgi_begin_request_body = self.FCGI_BEGIN_REQUEST_BODY_KEEP_CONN
+        else:
+            fcgi_begin_request_body = self.FCGI_BEGIN_REQUEST_BODY
+        fcgi_hdr = self.FCGI_HDR.pack(self.FCGI_VERSION, self.FCGI_BEGIN_REQUEST, self.request_id,
+                                      len(fcgi_begin_request_body), 0)
+        self.fcgi_begin_request = fcgi_hdr + fcgi_begin_request_body
+
+    @staticmethod
+    def encode_param_length(length):
+        # Lengths up to 127 take one byte, longer ones four bytes with the high bit set
+        if length < 128:
+            return bytes((length,))
+        return struct.pack("!I", length | 0x80000000)
+
+    def encode_params(self):
+        encode_length = self.encode_param_length
+        return b''.join([encode_length(len(name)) + encode_length(len(value)) + name + value
+                         for name, value in self.params])
 
     def define_params(self):
-        params = []
-        for name, value in self.params.items():
-            params.append(chr(len(name)) + chr(len(value)) + name + value)
-
-        params             = ''.join(params)
+        params             = self.fcgi_params_body
         params_length      = len(params)
-        params_padding_req = params_length & 7
+        params_padding_req = -params_length & 7
         params_padding     = b'\x00' * params_padding_req
 
-        fcgi_hdr_start = struct.pack("!BBHHBx", self.FCGI_VERSION, self.FCGI_PARAMS, \
-                                         self.request_id, params_length , params_padding_req)
-        fcgi_hdr_end   = struct.pack("!BBHHBx", self.FCGI_VERSION, self.FCGI_PARAMS, \
-                                         self.request_id, 0, 0)
-        self.fcgi_params = fcgi_hdr_start  + params.encode() + params_padding + fcgi_hdr_end
-
-    def execute(self):
-        try:
-            self.socket.send(self.fcgi_begin_request)
-            self.socket.send(self.fcgi_params)
-
-            header = self.socket.recv(self.FCGI_HDR_LENGTH)
+        pack_hdr       = self.FCGI_HDR.pack
+        fcgi_hdr_start = pack_hdr(self.FCGI_VERSION, self.FCGI_PARAMS, \
+                                  self.request_id, params_length , params_padding_req)
+        fcgi_hdr_end   = pack_hdr(self.FCGI_VERSION, self.FCGI_PARAMS, \
+                                  self.request_id, 0, 0)
+        self.fcgi_params = fcgi_hdr_start + params + params_padding + fcgi_hdr_end
+
+    def send_request(self):
+        # Hand both records to the kernel in a single scatter-gather call; the
+        # records are only joined if the kernel accepted part of them
+        sent = self.socket.sendmsg([self.fcgi_begin_request, self.fcgi_params])
+        if sent < len(self.fcgi_begin_request) + len(self.fcgi_params):
+            self.socket.sendall((self.fcgi_begin_request + self.fcgi_params)[sent:])
+
+    def recv_exactly(self, offset, length):
+        # Fill self._rxbuf[offset:offset + length], growing the buffer if needed
+        if offset + length > len(self._rxbuf):
+            self._rxbuf.extend(bytes(offset + length - len(self._rxbuf)))
+        # Release the view even on errors, a traceback holding it would keep
+        # self._rxbuf from being resized
+        with memoryview(self._rxbuf) as view:
+            received = 0
+            while received < length:
+                count = self.socket.recv_into(view[offset + received:offset + length])
+                if not count:
+                    raise EOFError("Connection closed by php-fpm.")
+                received += count
+
+    def recv_response(self):
+        # Read records up to FCGI_END_REQUEST, so a kept-open connection is left
+        # at a record boundary. FCGI_STDOUT contents are appended right after the
+        # header slot in self._rxbuf, overwriting the previous record's padding.
+        hdr_length = self.FCGI_HDR_LENGTH
+        body_length = 0
+        while True:
+            self.recv_exactly(0, hdr_length)
             fcgi_version, request_type, request_id, \
-            request_length, request_padding = struct.unpack("!BBHHBx", header)
+            request_length, request_padding = self.FCGI_HDR.unpack_from(self._rxbuf, 0)
 
-            if request_type == 6:
-                self.raw_status_data = self.socket.recv(request_length)
-            elif request_type == 7:
+            if request_type == self.FCGI_STDERR:
                 raise Exception("Received an error packet.")
-            else:
+            elif request_type not in (self.FCGI_STDOUT, self.FCGI_END_REQUEST):
                 raise Exception("Received unexpected packet type.")
+
+            self.recv_exactly(hdr_length + body_length, request_length + request_padding)
+            if request_type == self.FCGI_STDOUT:
+                body_length += request_length
+                continue
+
+            # FCGI_EndRequestBody: appStatus (4 bytes), protocolStatus (1 byte)
+            if self._rxbuf[hdr_length + body_length + 4] != self.FCGI_REQUEST_COMPLETE:
+                raise Exception("Request rejected by php-fpm.")
+            break
+        self.raw_status_data = bytes(memoryview(self._rxbuf)[hdr_length:hdr_length + body_length])
+
+    def execute(self):
+        connection_lost = False
+        try:
+            self.send_request()
+            self.recv_response()
+        except self.CONNECTION_LOST:
+            if not self.keep_conn:
+                self.report_error()
+            connection_lost = True
         except:
-            print("Unable to connect to php-fpm socket, OS error: " + str(sys.exc_info()[1]))
+            self.report_error()
+
+        if connection_lost:
+            # php-fpm closes kept-open connections when a worker reaches
+            # pm.max_requests or the pool reloads, so retry once on a new one.
+            # This runs outside the except block so the failed attempt's
+            # traceback is already released.
+            self.close()
+            self.connect()
+            try:
+                self.send_request()
+                self.recv_response()
+            except:
+                self.report_error()
+        self.extract_status()
+
+    def extract_status(self):
+        # Keep the body as bytes, fields are decoded individually by parse_status()
+        header_end = self.raw_status_data.find(b"\r\n\r\n")
+        if header_end < 0:
+            print("Invalid php-fpm status response: missing header separator.")
             sys.exit(3)
-        self.status_data = self.raw_status_data.decode().split("\r\n\r\n")[1]
+        self.status_data = self.raw_status_data[header_end + 4:]
 
     def make_request(self):
+        # Request IDs are 16 bit and 0 is reserved for management records
+        self.request_id = self.request_id % 0xffff + 1
         self.define_begin_request()
         self.define_params()
-        self.connect()
+        if self.socket is None:
+            self.connect()
         self.execute()
-        self.close()
+        if not self.keep_conn:
+            self.close()
+
+    def open_private(self, path, flags):
+        # Only use regular files owned by the current user, so other local users
+        # cannot plant a status or a lock file; returns None otherwise
+        try:
+            fd = os.open(path, flags | os.O_NOFOLLOW, 0o600)
+        except OSError:
+            return None
+        file_stat = os.fstat(fd)
+        if file_stat.st_uid != os.geteuid() or not stat.S_ISREG(file_stat.st_mode):
+            os.close(fd)
+            return None
+        return fd
+
+    def read_cache(self, cache_path, cache_ttl):
+        fd = self.open_private(cache_path, os.O_RDONLY)
+        if fd is None:
+            return False
+        with open(fd, "rb") as cache_file:
+            # A modification time in the future must not keep the cache valid
+            age = time.time() - os.fstat(fd).st_mtime
+            if not 0 <= age < cache_ttl:
+                return False
+            try:
+                data = cache_file.read()
+            except OSError:
+                return False
+        if b"\r\n\r\n" not in data:
+            return False
+        self.raw_status_data = data
+        self.extract_status()
+        return True
+
+    def write_cache(self, cache_path):
+        # Only needed on a cache miss, so keep it off the common path
+        import tempfile
+
+        # Write to a private file first so readers never see a partial response
+        cache_dir = os.path.dirname(cache_path) or "."
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir,
+                                            prefix=os.path.basename(cache_path) + ".")
+        except OSError:
+            return
+        try:
+            with open(fd, "wb") as cache_file:
+                cache_file.write(self.raw_status_data)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def lock_cache(self, lock_fd):
+        # Only needed when caching is enabled, so keep it off the common path
+        import fcntl
+
+        # Wait at most one socket timeout, a stuck or hostile lock holder must not
+        # hang the check
+        deadline = time.monotonic() + self.socket_timeout
+        while True:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(CACHE_LOCK_RETRY_DELAY)
+            except OSError:
+                return False
+
+    def make_cached_request(self, cache_path, cache_ttl):
+        """
+        Reuse a status response cached less than cache_ttl seconds ago, so
+        concurrent checks only hit php-fpm once per TTL. Falls back to a direct
+        request whenever the cache or its lock cannot be used safely.
+        """
+        if self.read_cache(cache_path, cache_ttl):
+            return
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", mode=0o700, exist_ok=True)
+        except OSError:
+            self.make_request()
+            return
+        lock_fd = self.open_private(cache_path + ".lock", os.O_WRONLY | os.O_CREAT)
+        if lock_fd is None:
+            self.make_request()
+            return
+        try:
+            if not self.lock_cache(lock_fd):
+                self.make_request()
+                return
+            # Another check may have refreshed the cache while we waited
+            if self.read_cache(cache_path, cache_ttl):
+                return
+            self.make_request()
+            self.write_cache(cache_path)
+        finally:
+            os.close(lock_fd)
 
     def print_status(self):
-        print(self.status_data)
-
-    def output_json_status(self):
-        out_list = {}
-        for line in self.status_data.splitlines():
-            params = line.split(":")
-            param  = params[0]
-            for values in params[1].split():
-                out_list[param] = values
-        return json.dumps(out_list)
-
-parser = argparse.ArgumentParser(description='Simple PHP-FPM status check script')
-parser.add_argument('-s', '--socket-path', help='Unix socket path of the php-fpm pool. ' + \
-                    'Current user requires permissions to access it. Defaults to ' + \
-                    DEFAULT_FPM_SOCKET_PATH + '.')
-parser.add_argument('-p', '--status-path', help='The path defined in php-fpm pool ' + \
-                    'configuration (pm.status_path). Defaults to ' + \
-                    DEFAULT_FPM_STATUS_PATH + '.')
-parser.add_argument('-qw', '--queue-warning', type=int, help='Warning threshold of ' + \
-                    'requests in listen queue. Defaults to ' + \
-                    str(LISTEN_QUEUE_WARNING) + '.')
-parser.add_argument('-qc', '--queue-critical', type=int, help='Critical threshold of ' + \
-                    'requests in listen queue. Defaults to ' + str(LISTEN_QUEUE_CRITICAL) + '.')
-parser.add_argument('-pw', '--processes-warning', type=int, help='Warning threshold of ' + \
-                    'total processes vs active ones. Defaults to ' + \
-                    str(ACTIVE_PROCESSES_PCT_WARNING) + '%%.')
-parser.add_argument('-pc', '--processes-critical', type=int, help='Critical threshold of ' + \
-                    'total processes vs active ones. Defaults to ' + \
-                    str(ACTIVE_PROCESSES_PCT_CRITICAL) + '%%.')
-
-args = parser.parse_args()
+        print(self.status_data.decode())
+
+    def parse_status(self, fields = None):
+        """
+        Return the status page as a dict. When fields is given, only those
+        are decoded and parsing stops as soon as all of them were found.
+        """
+        wanted = None if fields is None else {field.encode() for field in fields}
+        status = {}
+        for line in self.status_data.split(b"\n"):
+            param, separator, value = line.partition(b":")
+            if not separator:
+                continue
+            param = param.strip()
+            if wanted is None or param in wanted:
+                status[param.decode()] = value.strip().decode()
+                if wanted is not None and len(status) == len(wanted):
+                    break
+        return status
+
+# Command line options understood by the fast parser, mapped to their destination
+# and value type. Anything else falls back to the full argparse parser.
+CLI_OPTIONS = {
+    '-s': ('socket_path', str), '--socket-path': ('socket_path', str),
+    '-p': ('status_path', str), '--status-path': ('status_path', str),
+    '-qw': ('queue_warning', int), '--queue-warning': ('queue_warning', int),
+    '-qc': ('queue_critical', int), '--queue-critical': ('queue_critical', int),
+    '-pw': ('processes_warning', int), '--processes-warning': ('processes_warning', int),
+    '-pc': ('processes_critical', int), '--processes-critical': ('processes_critical', int),
+    '-d': ('daemon', int), '--daemon': ('daemon', int),
+    '-i': ('interval', float), '--interval': ('interval', float),
+    '--cache-ttl': ('cache_ttl', float),
+    '--cache-path': ('cache_path', str),
+}
+
+def parse_args_full(argv):
+    # Imported here as it is only needed for help output and usage errors
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Simple PHP-FPM status check script')
+    parser.add_argument('-s', '--socket-path', help='Unix socket path of the php-fpm pool. ' + \
+                        'Current user requires permissions to access it. Defaults to ' + \
+                        DEFAULT_FPM_SOCKET_PATH + '.')
+    parser.add_argument('-p', '--status-path', help='The path defined in php-fpm pool ' + \
+                        'configuration (pm.status_path). Defaults to ' + \
+                        DEFAULT_FPM_STATUS_PATH + '.')
+    parser.add_argument('-qw', '--queue-warning', type=int, help='Warning threshold of ' + \
+                        'requests in listen queue. Defaults to ' + \
+                        str(LISTEN_QUEUE_WARNING) + '.')
+    parser.add_argument('-qc', '--queue-critical', type=int, help='Critical threshold of ' + \
+                        'requests in listen queue. Defaults to ' + str(LISTEN_QUEUE_CRITICAL) + '.')
+    parser.add_argument('-pw', '--processes-warning', type=int, help='Warning threshold of ' + \
+                        'total processes vs active ones. Defaults to ' + \
+                        str(ACTIVE_PROCESSES_PCT_WARNING) + '%%.')
+    parser.add_argument('-pc', '--processes-critical', type=int, help='Critical threshold of ' + \
+                        'total processes vs active ones. Defaults to ' + \
+                        str(ACTIVE_PROCESSES_PCT_CRITICAL) + '%%.')
+    parser.add_argument('-d', '--daemon', type=int, metavar='SAMPLES', help='Keep the ' + \
+                        'connection to php-fpm open and check SAMPLES consecutive status ' + \
+                        'samples, printing a result for each one. Exits with the worst result.')
+    parser.add_argument('-i', '--interval', type=float, help='Seconds between samples in ' + \
+                        'daemon mode. Defaults to ' + str(DAEMON_INTERVAL) + '.')
+    parser.add_argument('--cache-ttl', type=float, metavar='SECONDS', help='Reuse a status ' + \
+                        'response fetched by another check less than SECONDS ago instead of ' + \
+                        'querying php-fpm. Disabled by default and ignored in daemon mode.')
+    parser.add_argument('--cache-path', help='File used to cache the status response. ' + \
+                        'Defaults to a file named after the socket and status paths in ' + \
+                        '$XDG_RUNTIME_DIR, or in ~/.cache when it is not set.')
+
+    return vars(parser.parse_args(argv))
+
+def parse_args(argv):
+    """
+    Parse the command line without building an argparse parser on every check.
+    Help, errors and unusual syntax are delegated to parse_args_full().
+    """
+    args = dict.fromkeys(dest for dest, _ in CLI_OPTIONS.values())
+    i = 0
+    while i < len(argv):
+        option, separator, value = argv[i].partition('=')
+        if option not in CLI_OPTIONS:
+            return parse_args_full(argv)
+        if not separator:
+            i += 1
+            if i == len(argv) or argv[i].startswith('-'):
+                return parse_args_full(argv)
+            value = argv[i]
+        dest, value_type = CLI_OPTIONS[option]
+        try:
+            args[dest] = value_type(value)
+        except ValueError:
+            return parse_args_full(argv)
+        i += 1
+    return args
+
+args = parse_args(sys.argv[1:])
 
 fpm_socket_path = DEFAULT_FPM_SOCKET_PATH
 fpm_status_path = DEFAULT_FPM_STATUS_PATH
@@ -161,24 +453,45 @@ listen_queue_warning = LISTEN_QUEUE_WARNING
 listen_queue_critical = LISTEN_QUEUE_CRITICAL
 active_percent_warning = ACTIVE_PROCESSES_PCT_WARNING
 active_percent_critical = ACTIVE_PROCESSES_PCT_CRITICAL
+daemon_samples = None
+daemon_interval = DAEMON_INTERVAL
+cache_ttl = 0
+cache_path = None
+
+if args['socket_path'] is not None:
+    fpm_socket_path = args['socket_path']
 
-if args.socket_path is not None:
-    fpm_socket_path = args.socket_path
+if args['status_path'] is not None:
+    fpm_status_path = args['status_path']
 
-if args.status_path is not None:
-    fpm_status_path = args.status_path
+if args['queue_warning'] is not None:
+    listen_queue_warning = args['queue_warning']
 
-if args.queue_warning is not None:
-    listen_queue_warning = args.queue_warning
+if args['queue_critical'] is not None:
+    listen_queue_critical = args['queue_critical']
 
-if args.queue_critical is not None:
-    listen_queue_critical = args.queue_critical
+if args['processes_warning'] is not None:
+    active_percent_warning = args['processes_warning']
 
-if args.processes_warning is not None:
-    active_percent_warning = args.processes_warning
+if args['processes_critical'] is not None:
+    active_percent_critical = args['processes_critical']
 
-if args.processes_critical is not None:
-    active_percent_critical = args.processes_critical
+if args['daemon'] is not None:
+    daemon_samples = args['daemon']
+
+if args['interval'] is not None:
+    daemon_interval = args['interval']
+
+if args['cache_ttl'] is not None:
+    cache_ttl = args['cache_ttl']
+
+if args['cache_path'] is not None:
+    cache_path = args['cache_path']
+else:
+    # Keep the default in a per-user directory rather than a shared one like /tmp
+    cache_dir = os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache")
+    cache_path = os.path.join(cache_dir, "check_phpfpm_status" + \
+                              (fpm_socket_path + fpm_status_path).replace("/", "_") + ".cache")
 
 if listen_queue_warning >= listen_queue_critical:
     print("Warning threshold should be less than critical.")
@@ -196,31 +509,63 @@ if active_percent_critical < 0 or active_percent_critical > 100:
     print("Warning threshold percentage should be between 0 and 100.")
     sys.exit(3)
 
-fcgi_client = FCGIStatusClient( socket_path = fpm_socket_path, status_path = fpm_status_path )
-fcgi_client.make_request()
-
-fpm_status = json.loads(fcgi_client.output_json_status())
-
-listen_queue = int(fpm_status["listen queue"])
-if listen_queue >= listen_queue_warning < listen_queue_critical:
-    print("Listen queue warning: " + str(listen_queue) + " requests in queue")
-    sys.exit(1)
-elif listen_queue >= listen_queue_critical:
-    print("Listen queue critical: " + str(listen_queue) + " requests in queue")
-    sys.exit(2)
-
-active_procs = int(fpm_status["active processes"])
-total_procs = int(fpm_status["total processes"])
-used_pct = active_procs/total_procs*100
+if daemon_samples is not None and daemon_samples < 1:
+    print("Number of daemon samples should be at least 1.")
+    sys.exit(3)
 
-if used_pct >= active_percent_warning < active_percent_critical:
-    print("Used php-fpm workers percent warning: " + str(used_pct) + "%")
-    sys.exit(1)
-elif used_pct >= active_percent_critical:
-    print("Used php-fpm workers percent warning: " + str(used_pct) + "%")
-    sys.exit(2)
+if not math.isfinite(daemon_interval) or daemon_interval < 0:
+    print("Daemon interval should be a non-negative number.")
+    sys.exit(3)
 
-print("php-fpm status normal: " + str(listen_queue) + " requests in queue, " + \
-      str(active_procs) + "/" + str(total_procs) + " used workers")
+if not math.isfinite(cache_ttl) or cache_ttl < 0:
+    print("Cache TTL should be a non-negative number.")
+    sys.exit(3)
 
-sys.exit(0)
+def check_status(fpm_status):
+    """
+    Evaluate a parsed status page against the thresholds.
+    Returns the Nagios exit code and the message to print.
+    """
+    listen_queue = int(fpm_status["listen queue"])
+    if listen_queue >= listen_queue_warning < listen_queue_critical:
+        return 1, "Listen queue warning: " + str(listen_queue) + " requests in queue"
+    elif listen_queue >= listen_queue_critical:
+        return 2, "Listen queue critical: " + str(listen_queue) + " requests in queue"
+
+    active_procs = int(fpm_status["active processes"])
+    total_procs = int(fpm_status["total processes"])
+    used_pct = active_procs/total_procs*100
+
+    if used_pct >= active_percent_warning < active_percent_critical:
+        return 1, "Used php-fpm workers percent warning: " + str(used_pct) + "%"
+    elif used_pct >= active_percent_critical:
+        return 2, "Used php-fpm workers percent warning: " + str(used_pct) + "%"
+
+    return 0, "php-fpm status normal: " + str(listen_queue) + " requests in queue, " + \
+              str(active_procs) + "/" + str(total_procs) + " used workers"
+
+if daemon_samples is None:
+    fcgi_client = FCGIStatusClient( socket_path = fpm_socket_path, status_path = fpm_status_path )
+    if cache_ttl > 0:
+        fcgi_client.make_cached_request(cache_path, cache_ttl)
+    else:
+        fcgi_client.make_request()
+
+    exit_code, message = check_status(fcgi_client.parse_status(CHECKED_STATUS_FIELDS))
+    print(message)
+    sys.exit(exit_code)
+
+fcgi_client = FCGIStatusClient( socket_path = fpm_socket_path, status_path = fpm_status_path,
+                                keep_conn = True )
+worst_exit_code = 0
+for sample in range(daemon_samples):
+    if sample:
+        time.sleep(daemon_interval)
+    fcgi_client.make_request()
+
+    exit_code, message = check_status(fcgi_client.parse_status(CHECKED_STATUS_FIELDS))
+    print(message, flush=True)
+    worst_exit_code = max(worst_exit_code, exit_code)
+fcgi_client.close()
+
+sys.exit(worst_exit_code)